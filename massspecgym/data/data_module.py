@@ -1,8 +1,13 @@
+import queue
+import threading
 import typing as T
 import pandas as pd
 import numpy as np
+import torch
 import pytorch_lightning as pl
 import massspecgym.utils as utils
+from lightning_utilities.core.apply_func import apply_to_collection
+from pytorch_lightning.utilities import move_data_to_device
 from pathlib import Path
 from typing import Optional
 from torch.utils.data.dataset import Subset
@@ -23,13 +28,32 @@ class MassSpecDataModule(pl.LightningDataModule):
         num_workers: int = 0,
         persistent_workers: bool = True,
         split_pth: Optional[Path] = None,
+        prefetch_factor: int = 4,
+        pin_memory: bool = True,
+        prefetch_to_device: bool = False,
         **kwargs
     ):
         """
         Args:
+            num_workers (int, optional): Number of data loader worker processes. Default is 0, in
+                which case the data is loaded in the main process.
+            persistent_workers (bool, optional): Whether to keep the worker processes alive between
+                epochs instead of re-spawning them. Ignored when `num_workers` is 0. Default is True.
             split_pth (Optional[Path], optional): Path to a .tsv file with columns "identifier" and "fold",
                 corresponding to dataset item IDs, and "fold", containg "train", "val", "test"
                 values. Default is None, in which case the split from the `dataset` is used.
+            prefetch_factor (int, optional): Number of batches loaded in advance by each worker.
+                Larger values hide storage latency better but increase memory usage proportionally
+                (`num_workers * prefetch_factor` batches are kept in memory). Ignored when
+                `num_workers` is 0. Default is 4.
+            pin_memory (bool, optional): Whether to collate batches into page-locked memory, which
+                speeds up host-to-GPU transfers (issued as non-blocking copies by Lightning). Has no
+                effect when training on CPU. Default is True.
+            prefetch_to_device (bool, optional): Whether to copy training batches to the GPU in a
+                background thread on a separate CUDA stream, overlapping the transfer of the next
+                batch with the computation on the current one. Only applied when training on a
+                single CUDA device (the background thread may deadlock collective operations under
+                DDP). Default is False.
         """
         super().__init__(**kwargs)
         self.dataset = dataset
@@ -37,6 +61,9 @@ class MassSpecDataModule(pl.LightningDataModule):
         self.batch_size = batch_size
         self.num_workers = num_workers
         self.persistent_workers = persistent_workers if num_workers > 0 else False
+        self.prefetch_factor = prefetch_factor if num_workers > 0 else None
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.prefetch_to_device = prefetch_to_device
 
     def prepare_data(self):
         """Pre-processing to be executed only on a single main device when using distributed training."""
@@ -47,44 +74,66 @@ class MassSpecDataModule(pl.LightningDataModule):
 
         # Prepare split
         if self.split_pth is None:
-            self.split = self.dataset.metadata[["identifier", "fold"]]
+            self.split = self.dataset.metadata[["identifier", "fold"]].astype({"fold": "category"})
         else:
             # NOTE: custom split is not tested
-            self.split = pd.read_csv(self.split_pth, sep="\t")
+            self.split = pd.read_csv(
+                self.split_pth, sep="\t", dtype={"identifier": str, "fold": "category"}
+            )
             if set(self.split.columns) != {"identifier", "fold"}:
                 raise ValueError('Split file must contain "id" and "fold" columns.')
-            self.split["identifier"] = self.split["identifier"].astype(str)
             if set(self.dataset.metadata["identifier"]) != set(self.split["identifier"]):
                 raise ValueError(
                     "Dataset item IDs must match the IDs in the split file."
                 )
 
         self.split = self.split.set_index("identifier")["fold"]
-        if not set(self.split) <= {"train", "val", "test"}:
+        # Missing folds are not categories, so they are checked separately
+        if (
+            self.split.isna().any()
+            or not set(self.split.cat.categories) <= {"train", "val", "test"}
+        ):
             raise ValueError(
                 '"Folds" column must contain only "train", "val", or "test" values.'
             )
 
-        # Split dataset
-        split_mask = self.split.loc[self.dataset.metadata["identifier"]].values
+        # Split dataset (folds are encoded as integer codes to compare them in a vectorized way)
+        folds = ["train", "val", "test"]
+        split_mask = pd.Categorical(
+            self.split.reindex(self.dataset.metadata["identifier"]), categories=folds
+        ).codes
         if stage == "fit" or stage is None:
             self.train_dataset = Subset(
-                self.dataset, np.where(split_mask == "train")[0]
+                self.dataset, np.flatnonzero(split_mask == folds.index("train"))
+            )
+            self.val_dataset = Subset(
+                self.dataset, np.flatnonzero(split_mask == folds.index("val"))
             )
-            self.val_dataset = Subset(self.dataset, np.where(split_mask == "val")[0])
         if stage == "test":
-            self.test_dataset = Subset(self.dataset, np.where(split_mask == "test")[0])
+            self.test_dataset = Subset(
+                self.dataset, np.flatnonzero(split_mask == folds.index("test"))
+            )
 
     def train_dataloader(self):
-        return DataLoader(
+        loader = DataLoader(
             self.train_dataset,
             batch_size=self.batch_size,
             shuffle=True,
             num_workers=self.num_workers,
             persistent_workers=self.persistent_workers,
+            prefetch_factor=self.prefetch_factor,
+            pin_memory=self.pin_memory,
             drop_last=False,
             collate_fn=self.dataset.collate_fn,
         )
+        if (
+            self.prefetch_to_device
+            and self.trainer is not None
+            and self.trainer.num_devices == 1
+            and self.trainer.strategy.root_device.type == "cuda"
+        ):
+            loader = _CUDAPrefetchLoader(loader, self.trainer.strategy.root_device)
+        return loader
 
     def val_dataloader(self):
         return DataLoader(
@@ -93,6 +142,8 @@ class MassSpecDataModule(pl.LightningDataModule):
             shuffle=False,
             num_workers=self.num_workers,
             persistent_workers=self.persistent_workers,
+            prefetch_factor=self.prefetch_factor,
+            pin_memory=self.pin_memory,
             drop_last=False,
             collate_fn=self.dataset.collate_fn,
         )
@@ -104,6 +155,78 @@ class MassSpecDataModule(pl.LightningDataModule):
             shuffle=False,
             num_workers=self.num_workers,
             persistent_workers=self.persistent_workers,
+            prefetch_factor=self.prefetch_factor,
+            pin_memory=self.pin_memory,
             drop_last=False,
             collate_fn=self.dataset.collate_fn,
         )
+
+
+class _CUDAPrefetchLoader:
+    """
+    Wrapper of a data loader that fetches batches in a background thread and copies them to a CUDA
+    device on a dedicated stream, so that the transfer of the next batch overlaps with the
+    computation on the current one.
+    """
+
+    _END = object()
+
+    def __init__(self, loader: DataLoader, device: torch.device, queue_size: int = 2):
+        self.loader = loader
+        self.device = device
+        self.queue_size = queue_size
+
+    def __len__(self) -> int:
+        return len(self.loader)
+
+    def __iter__(self) -> T.Iterator:
+        batches = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        stream = torch.cuda.Stream(device=self.device)
+
+        def put(item) -> bool:
+            # Put with a timeout to be able to exit when the consumer stops iterating early
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def prefetch():
+            try:
+                for batch in self.loader:
+                    with torch.cuda.stream(stream):
+                        batch = move_data_to_device(batch, self.device)
+                        event = torch.cuda.Event()
+                        event.record(stream)
+                    if not put((batch, event)):
+                        return
+            except Exception as e:
+                put(e)
+            else:
+                put(self._END)
+
+        thread = threading.Thread(target=prefetch, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is self._END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                batch, event = item
+
+                # Wait for the copy and prevent the caching allocator from reusing the memory of
+                # the batch for the side stream while it is still in use by the current stream
+                current_stream = torch.cuda.current_stream(self.device)
+                current_stream.wait_event(event)
+                apply_to_collection(
+                    batch, torch.Tensor, lambda t: t.record_stream(current_stream)
+                )
+                yield batch
+        finally:
+            stop.set()
+            thread.join()
@@ -1,5 +1,10 @@
 import pandas as pd
 import json
+import os
+import hashlib
+import itertools
+import shutil
+import tempfile
 import typing as T
 import numpy as np
 import torch
@@ -9,8 +14,8 @@ from pathlib import Path
 from rdkit import Chem
 from torch.utils.data.dataset import Dataset
 from torch.utils.data.dataloader import default_collate
-from matchms.importing import load_from_mgf
 from massspecgym.data.transforms import SpecTransform, MolTransform, MolToInChIKey
+from massspecgym.definitions import MASSSPECGYM_CACHE_DIR
 
 
 class MassSpecDataset(Dataset):
@@ -28,17 +33,36 @@ class MassSpecDataset(Dataset):
         return_mol_freq: bool = True,
         return_identifier: bool = True,
         identifiers_subset: T.Optional[T.List[str]] = None,
-        dtype: T.Type = torch.float32
+        precompute_mol: bool = True,
+        dtype: T.Type = torch.float32,
+        cache_dir: T.Optional[Path] = None,
+        half_precision_intensities: bool = False,
     ):
         """
         Args:
             pth (Optional[Path], optional): Path to the .tsv or .mgf file containing the mass spectra.
                 Default is None, in which case the MassSpecGym dataset is downloaded from HuggingFace Hub.
+                On the first use, the file is parsed into a columnar cache (see `_build_cache`),
+                which is memory-mapped on subsequent runs and shared by all data loader workers.
+            precompute_mol (bool, optional): Whether to apply `mol_transform` to each unique molecule
+                once at initialization instead of transforming the molecule in every `__getitem__`
+                call. Should be disabled for non-deterministic molecule transformations. Default is
+                True.
+            cache_dir (Optional[Path], optional): Directory to store the columnar caches of the
+                dataset files in. Default is None, in which case `MASSSPECGYM_CACHE_DIR` is used
+                (`~/.cache/massspecgym`, unless overridden by the environment variable of the same
+                name).
+            half_precision_intensities (bool, optional): Whether to cache the intensities of each
+                spectrum relative to its maximum intensity in half precision, which makes the cached
+                intensities four times smaller but changes them by up to 0.05% of the maximum
+                intensity. Default is False, in which case the intensities are cached exactly in
+                double precision.
         """
         self.pth = pth
         self.spec_transform = spec_transform
         self.mol_transform = mol_transform
         self.return_mol_freq = return_mol_freq
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else MASSSPECGYM_CACHE_DIR
 
         if self.pth is None:
             self.pth = utils.hugging_face_download("MassSpecGym.tsv")
@@ -46,93 +70,185 @@ class MassSpecDataset(Dataset):
         if isinstance(self.pth, str):
             self.pth = Path(self.pth)
 
-        if self.pth.suffix == ".tsv":
-            self.metadata = pd.read_csv(self.pth, sep="\t")
-            self.spectra = self.metadata.apply(
-                lambda row: matchms.Spectrum(
-                    mz=np.array([float(m) for m in row["mzs"].split(",")]),
-                    intensities=np.array(
-                        [float(i) for i in row["intensities"].split(",")]
-                    ),
-                    metadata={"precursor_mz": row["precursor_mz"]},
-                ),
-                axis=1,
-            )
-            self.metadata = self.metadata.drop(columns=["mzs", "intensities"])
-        elif self.pth.suffix == ".mgf":
-            self.spectra = list(load_from_mgf(str(self.pth)))
-            self.metadata = pd.DataFrame([s.metadata for s in self.spectra])
-        else:
-            raise ValueError(f"{self.pth.suffix} file format not supported.")
-        
+        # Load spectra from the columnar cache (built once per dataset file)
+        self.cache_pth = _build_cache(self.pth, self.cache_dir, half_precision_intensities)
+        self.metadata = pd.read_pickle(self.cache_pth / "metadata.pkl")
+        self._mmap_pths = {}
+        self._load_mmap("mzs", self.cache_pth / "mzs.npy")
+        self._load_mmap("intensities", self.cache_pth / "intensities.npy")
+        intensity_scales = np.load(self.cache_pth / "intensity_scales.npy")
+        offsets = np.load(self.cache_pth / "offsets.npy")
+
         if identifiers_subset is not None:
             self.metadata = self.metadata[self.metadata["identifier"].isin(identifiers_subset)]
-            self.spectra = self.spectra[self.metadata.index].reset_index(drop=True)
-            self.metadata = self.metadata.reset_index(drop=True)
+
+        # Peak ranges of the (possibly subsetted) spectra in the concatenated arrays
+        self.spec_starts = offsets[:-1][self.metadata.index]
+        self.spec_ends = offsets[1:][self.metadata.index]
+        self.intensity_scales = intensity_scales[self.metadata.index]
+        self.metadata = self.metadata.reset_index(drop=True)
 
         if self.return_mol_freq:
             if "inchikey" not in self.metadata.columns:
                 self.metadata["inchikey"] = self.metadata["smiles"].apply(utils.smiles_to_inchi_key)
             self.metadata["mol_freq"] = self.metadata.groupby("inchikey")["inchikey"].transform("count")
 
+        # Metadata columns accessed in __getitem__, stored as numpy arrays to avoid constructing a
+        # pandas row for each item
+        self.smiles = self.metadata["smiles"].to_numpy()
+        self.precursor_mz = self.metadata["precursor_mz"].to_numpy(dtype=np.float64)
+        self.adduct = self.metadata["adduct"].to_numpy()
+        self.identifier = self.metadata["identifier"].to_numpy()
+        if self.return_mol_freq:
+            self.mol_freq = self.metadata["mol_freq"].to_numpy()
+
+        # Precompute molecule transformations for each unique molecule. Binary outputs (e.g.,
+        # fingerprints) are stored bit-packed, with their original sizes in `mol_cache_n_bits`
+        self.mol_cache = None
+        if precompute_mol and self.mol_transform:
+            # Missing SMILES would get the code -1, i.e., the last precomputed molecule
+            if self.metadata["smiles"].isna().any():
+                raise ValueError("Cannot precompute molecule transformations for missing SMILES.")
+            self.mol_codes, unique_smiles = pd.factorize(self.metadata["smiles"])
+            mol_transforms = self.mol_transform if isinstance(self.mol_transform, dict) \
+                else {"mol": self.mol_transform}
+            self.mol_cache, self.mol_cache_n_bits = {}, {}
+            for key, transform in mol_transforms.items():
+                if transform is None:
+                    continue
+                mols, n_bits = _pack_mols(_stack_mols([transform(s) for s in unique_smiles]))
+                if n_bits is not None:
+                    self.mol_cache_n_bits[key] = n_bits
+                self.mol_cache[key] = mols
+
+        # Item keys of tensors with variable first dimensions (e.g., spectra from
+        # `SpecTokenizer(n_peaks=None)`), which are always concatenated in `collate_fn`
+        self.ragged_keys = set()
+        for transforms, default_key in [(self.spec_transform, "spec"), (self.mol_transform, "mol")]:
+            if not isinstance(transforms, dict):
+                transforms = {default_key: transforms}
+            for key, transform in transforms.items():
+                if getattr(transform, "variable_length", False):
+                    self.ragged_keys.add(key)
+
         self.return_identifier = return_identifier
         self.dtype = dtype
 
+    def _load_mmap(self, name: str, pth: Path) -> None:
+        """
+        Memory-map an array from a cache file into the attribute `name`.
+        """
+        setattr(self, name, np.load(pth, mmap_mode="r"))
+        self._mmap_pths[name] = pth
+
+    def __getstate__(self) -> dict:
+        # Do not copy the memory-mapped arrays into the pickle (e.g., when sending the dataset to
+        # data loader workers started with "spawn"), but map them again after unpickling, so that
+        # all worker processes share the same pages of the cache files
+        state = self.__dict__.copy()
+        for name in self._mmap_pths:
+            del state[name]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        for name, pth in self._mmap_pths.items():
+            setattr(self, name, np.load(pth, mmap_mode="r"))
+
     def __len__(self) -> int:
-        return len(self.spectra)
+        return len(self.metadata)
+
+    def get_spectrum(self, i: int) -> matchms.Spectrum:
+        """
+        Construct a matchms spectrum for the i-th item from the cached peak arrays. The metadata
+        is already in the matchms format, so its harmonization (which dominates the construction
+        time of small spectra) is skipped.
+        """
+        start, end = self.spec_starts[i], self.spec_ends[i]
+        return matchms.Spectrum(
+            mz=np.asarray(self.mzs[start:end], dtype=np.float64),
+            intensities=self.intensities[start:end].astype(np.float64) * self.intensity_scales[i],
+            metadata={"precursor_mz": self.precursor_mz[i]},
+            metadata_harmonization=False,
+        )
+
+    def transform_mol(self, i: int, transform: T.Optional[MolTransform], key: str = "mol"):
+        """
+        Apply a molecule transformation to the molecule of the i-th item, using the precomputed
+        result if available.
+        """
+        if transform is None:
+            return self.smiles[i]
+        if self.mol_cache is not None:
+            mol = self.mol_cache[key][self.mol_codes[i]]
+            if key in self.mol_cache_n_bits:
+                mol = np.unpackbits(mol, count=self.mol_cache_n_bits[key])
+            return mol
+        return transform(self.smiles[i])
 
     def __getitem__(
         self, i: int, transform_spec: bool = True, transform_mol: bool = True
     ) -> dict:
-        spec = self.spectra[i]
-        metadata = self.metadata.iloc[i]
-        mol = metadata["smiles"]
+        spec = self.get_spectrum(i)
+        spec_transform, mol_transform = self.spec_transform, self.mol_transform
 
         # Apply all transformations to the spectrum
         item = {}
-        if transform_spec and self.spec_transform:
-            if isinstance(self.spec_transform, dict):
-                for key, transform in self.spec_transform.items():
+        if transform_spec and spec_transform:
+            if isinstance(spec_transform, dict):
+                for key, transform in spec_transform.items():
                     item[key] = transform(spec) if transform is not None else spec
             else:
-                item["spec"] = self.spec_transform(spec)
+                item["spec"] = spec_transform(spec)
         else:
             item["spec"] = spec
 
         # Apply all transformations to the molecule
-        if transform_mol and self.mol_transform:
-            if isinstance(self.mol_transform, dict):
-                for key, transform in self.mol_transform.items():
-                    item[key] = transform(mol) if transform is not None else mol
+        if transform_mol and mol_transform:
+            if isinstance(mol_transform, dict):
+                for key, transform in mol_transform.items():
+                    item[key] = self.transform_mol(i, transform, key)
             else:
-                item["mol"] = self.mol_transform(mol)
+                item["mol"] = self.transform_mol(i, mol_transform)
         else:
-            item["mol"] = mol
+            item["mol"] = self.smiles[i]
 
         # Add other metadata to the item
-        item.update({
-            k: metadata[k] for k in ["precursor_mz", "adduct"]
-        })
+        item["precursor_mz"] = self.precursor_mz[i]
+        item["adduct"] = self.adduct[i]
 
         if self.return_mol_freq:
-            item["mol_freq"] = metadata["mol_freq"]
+            item["mol_freq"] = self.mol_freq[i]
 
         if self.return_identifier:
-            item["identifier"] = metadata["identifier"]
+            item["identifier"] = self.identifier[i]
 
         # TODO: this should be refactored
+        dtype = self.dtype
         for k, v in item.items():
             if not isinstance(v, str):
-                item[k] = torch.as_tensor(v, dtype=self.dtype)
+                item[k] = torch.as_tensor(v, dtype=dtype)
 
         return item
 
-    @staticmethod
-    def collate_fn(batch: T.Iterable[dict]) -> dict:
+    def collate_fn(self, batch: T.Iterable[dict]) -> dict:
         """
-        Custom collate function to handle the outputs of __getitem__.
+        Custom collate function to handle the outputs of __getitem__. Tensors under `ragged_keys`
+        (outputs of transformations with `variable_length`, e.g., spectra with variable numbers of
+        peaks from `SpecTokenizer(n_peaks=None)`) are not padded but concatenated along the first
+        dimension, with the numbers of rows of each item stored under the `<key>_batch_ptr` key (in
+        the same way as retrieval candidates are collated with `batch_ptr`). This layout does not
+        depend on the items in the batch.
         """
-        return default_collate(batch)
+        collated_batch = {}
+        for k in batch[0].keys():
+            vals = [item[k] for item in batch]
+            if k in self.ragged_keys:
+                collated_batch[k] = torch.cat(vals)
+                collated_batch[f"{k}_batch_ptr"] = torch.tensor([v.shape[0] for v in vals])
+            else:
+                collated_batch[k] = default_collate(vals)
+        return collated_batch
 
 
 class RetrievalDataset(MassSpecDataset):
@@ -176,9 +292,64 @@ class RetrievalDataset(MassSpecDataset):
             else:
                 self.candidates_pth = utils.hugging_face_download(candidates_pth)
 
-        # Read candidates_pth from json to dict: SMILES -> respective candidate SMILES
-        with open(self.candidates_pth, "r") as file:
-            self.candidates = json.load(file)
+        # Load candidates from the columnar cache (built once per candidates file): the candidates
+        # of each query molecule are stored as codes into the array of unique candidate SMILES
+        cache_pth = _build_candidates_cache(Path(self.candidates_pth), self.cache_dir)
+        self.candidates_smiles = pd.read_pickle(cache_pth / "candidates_smiles.pkl")
+        self._load_mmap("candidates_codes", cache_pth / "candidates_codes.npy")
+        self.candidates_offsets = np.load(cache_pth / "candidates_offsets.npy")
+
+        # Position of each item's query molecule in the cache (-1 if there are no candidates)
+        queries = pd.read_pickle(cache_pth / "queries.pkl")
+        self.candidates_idx = pd.Index(queries).get_indexer(self.smiles)
+
+        # Labels of the query and candidate molecules of the dataset items (e.g., InChIKeys),
+        # computed once for all items
+        queries_idx = np.unique(self.candidates_idx[self.candidates_idx != -1])
+        candidates_idx = np.unique(np.concatenate([np.empty(0, dtype=np.int32)] + [
+            self.candidates_codes[self.candidates_offsets[j]:self.candidates_offsets[j + 1]]
+            for j in queries_idx
+        ]))
+        labels = _load_labels(
+            cache_pth,
+            {
+                "queries": (queries, queries_idx),
+                "candidates": (self.candidates_smiles, candidates_idx),
+            },
+            self.mol_label_transform,
+        )
+        self.queries_labels, self.candidates_labels = labels["queries"], labels["candidates"]
+
+        # Precompute the molecule transformation of the candidates of the dataset items in the same
+        # way as for the query molecules. `candidates_mol_codes` maps candidate codes to rows of
+        # `candidates_mol_cache` (-1 for candidates that could not be transformed, which are
+        # transformed again in __getitem__ to raise the error)
+        self.candidates_mol_cache = None
+        if self.mol_cache is not None:
+            mols, transformed_idx = [], []
+            for j in candidates_idx:
+                try:
+                    mols.append(self.mol_transform(self.candidates_smiles[j]))
+                    transformed_idx.append(j)
+                except Exception:
+                    pass
+            self.candidates_mol_cache, self.candidates_mol_n_bits = _pack_mols(_stack_mols(mols))
+            self.candidates_mol_codes = np.full(len(self.candidates_smiles), -1, dtype=np.int32)
+            self.candidates_mol_codes[transformed_idx] = np.arange(len(transformed_idx))
+
+    def transform_candidates(self, candidates_codes: np.ndarray) -> T.Union[list, np.ndarray]:
+        """
+        Apply the molecule transformation to candidates given by their codes, using the
+        precomputed results if available.
+        """
+        if self.candidates_mol_cache is not None:
+            rows = self.candidates_mol_codes[candidates_codes]
+            if (rows != -1).all():
+                mols = self.candidates_mol_cache[rows]
+                if self.candidates_mol_n_bits is not None:
+                    mols = np.unpackbits(mols, axis=1, count=self.candidates_mol_n_bits)
+                return mols if mols.dtype != object else mols.tolist()
+        return [self.mol_transform(c) for c in self.candidates_smiles[candidates_codes]]
 
     def __getitem__(self, i) -> dict:
         item = super().__getitem__(i, transform_mol=False)
@@ -187,18 +358,22 @@ class RetrievalDataset(MassSpecDataset):
         item["smiles"] = item["mol"]
 
         # Get candidates
-        if item["mol"] not in self.candidates:
+        j = self.candidates_idx[i]
+        if j == -1:
             raise ValueError(f'No candidates for the query molecule {item["mol"]}.')
-        item["candidates"] = self.candidates[item["mol"]]
+        candidates_codes = self.candidates_codes[
+            self.candidates_offsets[j]:self.candidates_offsets[j + 1]
+        ]
+        item["candidates"] = self.candidates_smiles[candidates_codes].tolist()
 
         # Save the original SMILES representations of the canidates (for evaluation)
         item["candidates_smiles"] = item["candidates"]
 
         # Create neg/pos label mask by matching the query molecule with the candidates
-        item_label = self.mol_label_transform(item["mol"])
-        item["labels"] = [
-            self.mol_label_transform(c) == item_label for c in item["candidates"]
-        ]
+        item_label = self.queries_labels[j]
+        if item_label is None:
+            raise ValueError(f'Label of the query molecule {item["mol"]} cannot be computed.')
+        item["labels"] = (self.candidates_labels[candidates_codes] == item_label).tolist()
 
         if not any(item["labels"]):
             raise ValueError(
@@ -207,21 +382,20 @@ class RetrievalDataset(MassSpecDataset):
 
         # Transform the query and candidate molecules
         if self.mol_transform:
-            item["mol"] = self.mol_transform(item["mol"])
-            item["candidates"] = [self.mol_transform(c) for c in item["candidates"]]
+            item["mol"] = self.transform_mol(i, self.mol_transform)
+            item["candidates"] = self.transform_candidates(candidates_codes)
         if isinstance(item["mol"], np.ndarray):
             item["mol"] = torch.as_tensor(item["mol"], dtype=self.dtype)
-            item["candidates"] = torch.as_tensor(np.stack(item["candidates"]), dtype=self.dtype)
+            item["candidates"] = torch.as_tensor(np.asarray(item["candidates"]), dtype=self.dtype)
 
         return item
 
-    @staticmethod
-    def collate_fn(batch: T.Iterable[dict]) -> dict:
+    def collate_fn(self, batch: T.Iterable[dict]) -> dict:
         # Standard collate for everything except candidates and their labels (which may have different length per sample)
-        collated_batch = {}
-        for k in batch[0].keys():
-            if k not in ["candidates", "labels", "candidates_smiles"]:
-                collated_batch[k] = default_collate([item[k] for item in batch])
+        collated_batch = super().collate_fn([
+            {k: v for k, v in item.items() if k not in ["candidates", "labels", "candidates_smiles"]}
+            for item in batch
+        ])
 
         # Collate candidates and labels by concatenating and storing sizes of each list
         collated_batch["candidates"] = torch.as_tensor(
@@ -239,4 +413,209 @@ class RetrievalDataset(MassSpecDataset):
         return collated_batch
 
 
+def _stack_mols(mols: list) -> np.ndarray:
+    """
+    Stack transformed molecules into a single array if they are arrays of the same shape (e.g.,
+    fingerprints), or into an object array otherwise (e.g., strings).
+    """
+    if all(isinstance(m, np.ndarray) for m in mols) and len({m.shape for m in mols}) == 1:
+        return np.stack(mols)
+    mols_arr = np.empty(len(mols), dtype=object)
+    for i, m in enumerate(mols):
+        mols_arr[i] = m
+    return mols_arr
+
+
+def _pack_mols(mols: np.ndarray) -> T.Tuple[np.ndarray, T.Optional[int]]:
+    """
+    Bit-pack stacked binary molecule representations (e.g., fingerprints) along the last axis.
+    Returns the (possibly) packed array and the original number of bits, or None if the
+    representations are not binary and are returned as they are.
+    """
+    if mols.dtype != object and mols.ndim == 2 and np.isin(mols, (0, 1)).all():
+        return np.packbits(mols.astype(np.uint8), axis=1), mols.shape[1]
+    return mols, None
+
+
+# Version of the cache format, to be increased whenever the format changes
+_CACHE_VERSION = 3
+
+
+def _cache_pth(pth: Path, cache_dir: Path, options: T.Tuple = ()) -> Path:
+    """
+    Path to the cache directory of a dataset file. The name depends on the absolute path, the
+    modification time and the size of the file (and the cache format version and the `options`
+    of the cache), so that the cache is rebuilt whenever the file changes.
+    """
+    stat = pth.stat()
+    key = f"{pth.resolve()}_{stat.st_mtime_ns}_{stat.st_size}_{_CACHE_VERSION}_{options}"
+    key = hashlib.md5(key.encode()).hexdigest()[:16]
+    return cache_dir / f"{pth.stem}_{key}"
+
+
+def _build_cache(pth: Path, cache_dir: Path, half_precision_intensities: bool = False) -> Path:
+    """
+    Parse a .tsv or .mgf file with mass spectra into a columnar cache in `cache_dir` and return the
+    path to it. The cache is a directory containing:
+        - `mzs.npy`, `intensities.npy`: m/z values and intensities of all spectra concatenated into
+          flat arrays. If `half_precision_intensities` is True, intensities are divided by the
+          maximum intensity of each spectrum and stored as float16, otherwise they are stored
+          as they are,
+        - `intensity_scales.npy`: scales of the intensities of each spectrum (the maximum
+          intensities or ones), restoring the original intensities when multiplied with the
+          stored ones,
+        - `offsets.npy`: CSR-style offsets, such that the peaks of the i-th spectrum are stored at
+          positions `offsets[i]:offsets[i + 1]`,
+        - `metadata.pkl`: pandas data frame with the metadata of the spectra (one row per spectrum).
+    If the cache already exists, the file is not parsed again.
+    """
+    cache_pth = _cache_pth(pth, cache_dir, (half_precision_intensities,))
+    if cache_pth.exists():
+        return cache_pth
+
+    if pth.suffix == ".tsv":
+        # Parse all peaks in a single vectorized pass over the concatenated peak strings
+        metadata = pd.read_csv(pth, sep="\t")
+        n_peaks = metadata["mzs"].str.count(",").to_numpy() + 1
+        mzs = np.fromstring(",".join(metadata["mzs"]), sep=",")
+        intensities = np.fromstring(",".join(metadata["intensities"]), sep=",")
+        metadata = metadata.drop(columns=["mzs", "intensities"])
+    elif pth.suffix == ".mgf":
+        n_peaks, mzs, intensities, metadata = utils.parse_mgf(pth)
+    else:
+        raise ValueError(f"{pth.suffix} file format not supported.")
+
+    offsets = np.zeros(len(n_peaks) + 1, dtype=np.int64)
+    np.cumsum(n_peaks, out=offsets[1:])
+    if offsets[-1] != len(mzs) or len(mzs) != len(intensities):
+        raise ValueError(f"Inconsistent numbers of m/z values and intensities in {pth}.")
+
+    intensity_scales = np.ones(len(n_peaks), dtype=np.float64)
+    if half_precision_intensities:
+        # Normalize intensities of each spectrum to [0, 1] to store them in half precision
+        nonempty = np.diff(offsets) > 0
+        if nonempty.any():
+            intensity_scales[nonempty] = np.maximum.reduceat(intensities, offsets[:-1][nonempty])
+        intensity_scales[intensity_scales <= 0] = 1
+        intensities = intensities / np.repeat(intensity_scales, np.diff(offsets))
+        intensities = intensities.astype(np.float16)
+
+    _save_cache(
+        cache_pth,
+        arrays={
+            "mzs": mzs.astype(np.float64),
+            "intensities": intensities,
+            "intensity_scales": intensity_scales,
+            "offsets": offsets,
+        },
+        objects={"metadata": metadata},
+    )
+
+    return cache_pth
+
+
+def _build_candidates_cache(pth: Path, cache_dir: Path) -> Path:
+    """
+    Parse a .json file with retrieval candidates (mapping query SMILES to lists of candidate
+    SMILES) into a columnar cache in `cache_dir` and return the path to it. The cache is a
+    directory containing:
+        - `queries.pkl`: array of query SMILES,
+        - `candidates_smiles.pkl`: array of unique candidate SMILES,
+        - `candidates_codes.npy`: candidates of all queries concatenated into a flat array of
+          indices into `candidates_smiles`,
+        - `candidates_offsets.npy`: CSR-style offsets, such that the candidates of the i-th query
+          are stored at positions `candidates_offsets[i]:candidates_offsets[i + 1]`.
+    If the cache already exists, the file is not parsed again.
+    """
+    cache_pth = _cache_pth(pth, cache_dir)
+    if cache_pth.exists():
+        return cache_pth
+
+    with open(pth, "r") as file:
+        candidates = json.load(file)
+
+    offsets = np.zeros(len(candidates) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in candidates.values()], out=offsets[1:])
+    codes, candidates_smiles = pd.factorize(np.fromiter(
+        itertools.chain.from_iterable(candidates.values()), dtype=object, count=offsets[-1]
+    ))
+
+    _save_cache(
+        cache_pth,
+        arrays={
+            "candidates_codes": codes.astype(np.int32),
+            "candidates_offsets": offsets,
+        },
+        objects={
+            "queries": np.array(list(candidates.keys()), dtype=object),
+            "candidates_smiles": np.asarray(candidates_smiles, dtype=object),
+        },
+    )
+
+    return cache_pth
+
+
+def _load_labels(
+    cache_pth: Path,
+    mols: T.Dict[str, T.Tuple[np.ndarray, np.ndarray]],
+    mol_label_transform: MolTransform,
+) -> T.Dict[str, np.ndarray]:
+    """
+    Compute labels of molecules with `mol_label_transform`. `mols` maps names to pairs of SMILES
+    arrays and indices of the molecules to label. Labels of the other molecules, and of molecules
+    that cannot be transformed, are None. If the transformation defines a `cache_key`, the labels
+    are stored in the cache directory `cache_pth` and only the missing ones are computed later.
+    """
+    labels_pth = None
+    if mol_label_transform.cache_key is not None:
+        labels_pth = cache_pth / f"labels_{mol_label_transform.cache_key}.pkl"
+    cached = pd.read_pickle(labels_pth) if labels_pth is not None and labels_pth.exists() else {}
+
+    # Labels and masks of already labeled molecules for each name
+    labels, updated = {}, False
+    for name, (smiles, idx) in mols.items():
+        name_labels, labeled = cached.get(name, (
+            np.full(len(smiles), None, dtype=object), np.zeros(len(smiles), dtype=bool)
+        ))
+        missing = idx[~labeled[idx]]
+        for j in missing:
+            try:
+                name_labels[j] = mol_label_transform(smiles[j])
+            except Exception:
+                name_labels[j] = None
+        labeled[missing] = True
+        labels[name] = (name_labels, labeled)
+        updated |= len(missing) > 0
+
+    if labels_pth is not None and updated:
+        # Write to a temporary file first to never read partially written labels
+        fd, tmp_pth = tempfile.mkstemp(dir=cache_pth, prefix=f".{labels_pth.name}_")
+        os.close(fd)
+        pd.to_pickle(labels, tmp_pth)
+        os.replace(tmp_pth, labels_pth)
+
+    return {name: name_labels for name, (name_labels, _) in labels.items()}
+
+
+def _save_cache(
+    cache_pth: Path, arrays: T.Dict[str, np.ndarray], objects: T.Dict[str, T.Any]
+) -> None:
+    """
+    Save numpy arrays (as .npy files) and other objects (as pickles) into a cache directory.
+    """
+    # Write to a temporary directory first, so that concurrent processes (e.g., DDP ranks) never
+    # read a partially written cache
+    cache_pth.parent.mkdir(parents=True, exist_ok=True)
+    tmp_pth = Path(tempfile.mkdtemp(dir=cache_pth.parent, prefix=f".{cache_pth.name}_"))
+    for name, arr in arrays.items():
+        np.save(tmp_pth / f"{name}.npy", arr)
+    for name, obj in objects.items():
+        pd.to_pickle(obj, tmp_pth / f"{name}.pkl")
+    try:
+        tmp_pth.rename(cache_pth)
+    except OSError:
+        # The cache was built by another process in the meantime
+        shutil.rmtree(tmp_pth, ignore_errors=True)
+
+
 # TODO: Datasets for unlabeled data.
@@ -1,4 +1,5 @@
 """Global variables used across the package."""
+import os
 import pathlib
 
 # Dirs
@@ -7,6 +8,9 @@ MASSSPECGYM_REPO_DIR = MASSSPECGYM_ROOT_DIR.parent
 MASSSPECGYM_DATA_DIR = MASSSPECGYM_REPO_DIR / 'data'
 MASSSPECGYM_TEST_RESULTS_DIR = MASSSPECGYM_DATA_DIR / 'test_results'
 MASSSPECGYM_ASSETS_DIR = MASSSPECGYM_REPO_DIR / 'assets'
+MASSSPECGYM_CACHE_DIR = pathlib.Path(
+    os.environ.get('MASSSPECGYM_CACHE_DIR', pathlib.Path.home() / '.cache' / 'massspecgym')
+)
 
 # Special tokens
 PAD_TOKEN = "<pad>"
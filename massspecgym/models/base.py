@@ -5,6 +5,7 @@ from abc import ABC, abstractmethod
 from pathlib import Path
 
 import torch
+import pandas as pd
 import pytorch_lightning as pl
 from torchmetrics import Metric, SumMetric
 from massspecgym.utils import ReturnScalarBootStrapper
@@ -180,5 +181,16 @@ class MassSpecGymModel(pl.LightningModule, ABC):
     def _update_df_test(self, dct: dict) -> None:
         for col, vals in dct.items():
             if isinstance(vals, torch.Tensor):
-                vals = vals.tolist()
-            self.df_test[col].extend(vals)
+                # Keep tensors on the device and concatenate them once at the end of the epoch
+                # (see `_get_df_test`) to avoid a device-host synchronization per batch
+                self.df_test[col].append(vals.detach())
+            else:
+                self.df_test[col].extend(vals)
+
+    def _get_df_test(self) -> pd.DataFrame:
+        df_test = {}
+        for col, vals in self.df_test.items():
+            if vals and isinstance(vals[0], torch.Tensor):
+                vals = torch.cat(vals).tolist()
+            df_test[col] = vals
+        return pd.DataFrame(df_test)
@@ -4,7 +4,7 @@ from abc import ABC
 import torch
 import pandas as pd
 from rdkit import Chem
-from rdkit.DataStructs import TanimotoSimilarity
+from rdkit.DataStructs import ExplicitBitVect, TanimotoSimilarity
 from torchmetrics.aggregation import MeanMetric
 
 from massspecgym.models.base import MassSpecGymModel, Stage
@@ -27,7 +27,8 @@ class DeNovoMassSpecGymModel(MassSpecGymModel, ABC):
         self.mol_pred_kind: T.Literal["smiles", "rdkit"] = "smiles"
         # caches of already computed results to avoid expensive re-computations
         self.mces_cache = dict()
-        self.mol_2_morgan_fp = dict()
+        self.smiles_2_morgan_fp = dict()
+        self.smiles_2_inchi_key = dict()
 
     def on_batch_end(
         self,
@@ -109,21 +110,24 @@ class DeNovoMassSpecGymModel(MassSpecGymModel, ABC):
         smile_true = mol_true
         mol_true = [Chem.MolFromSmiles(sm) for sm in mol_true]
 
-        def _get_morgan_fp_with_cache(mol):
-            """
-            A helper function to retrieve either cached Morgan Fingerprint value, or to compute and cache it
-            @param mol: RDKit molecule object
-            @return:
-            """
-            if mol not in self.mol_2_morgan_fp:
-                self.mol_2_morgan_fp[mol] = morgan_fp(mol, to_np=False)
-            return self.mol_2_morgan_fp[mol]
+        # Compute Morgan fingerprints and InChIKeys once for all top-k values
+        fps_pred = [
+            [self._get_morgan_fp_with_cache(s, m) for s, m in zip(ss, ms)]
+            for ss, ms in zip(smiles_pred, mols_pred)
+        ]
+        fp_true = [self._get_morgan_fp_with_cache(s, m) for s, m in zip(smile_true, mol_true)]
+        inchi_keys_pred = [
+            [self._get_inchi_key_with_cache(s, m) for s, m in zip(ss, ms)]
+            for ss, ms in zip(smiles_pred, mols_pred)
+        ]
+        inchi_keys_true = [
+            self._get_inchi_key_with_cache(s, m) for s, m in zip(smile_true, mol_true)
+        ]
 
         # Evaluate top-k metrics
         for top_k in self.top_ks:
             # Get top-k predicted molecules for each ground-truth sample
             smiles_pred_top_k = [smiles_pred_sample[:top_k] for smiles_pred_sample in smiles_pred]
-            mols_pred_top_k = [mols_pred_sample[:top_k] for mols_pred_sample in mols_pred]
 
             # 1. Evaluate minimum common edge subgraph:  
             # Calculate MCES distance between top-k predicted molecules and ground truth and
@@ -162,11 +166,7 @@ class DeNovoMassSpecGymModel(MassSpecGymModel, ABC):
             # Calculate Tanimoto similarity between top-k predicted molecules and ground truth and
             # report the maximum similarity. The maximum similarities for each sample in the batch
             # are averaged across the epoch.
-            fps_pred_top_k = [
-                [_get_morgan_fp_with_cache(m) if m is not None else None for m in ms]
-                for ms in mols_pred_top_k
-            ]
-            fp_true = [_get_morgan_fp_with_cache(m) for m in mol_true]
+            fps_pred_top_k = [fps_pred_sample[:top_k] for fps_pred_sample in fps_pred]
 
             max_tanimoto_sims = []
             # Iterate over batch
@@ -195,12 +195,9 @@ class DeNovoMassSpecGymModel(MassSpecGymModel, ABC):
             # Calculate if the ground truth molecule is in the top-k predicted molecules and report
             # the average across the epoch.
             in_top_k = [
-                mol_to_inchi_key(true) in [
-                    mol_to_inchi_key(pred)
-                    if pred is not None else None
-                    for pred in preds
-                ]
-                for true, preds in zip(mol_true, mols_pred_top_k)
+                # Invalid molecules have no InChIKeys and never match
+                true is not None and true in preds[:top_k]
+                for true, preds in zip(inchi_keys_true, inchi_keys_pred)
             ]
             in_top_k = torch.tensor(in_top_k, device=self.device)
 
@@ -217,6 +214,31 @@ class DeNovoMassSpecGymModel(MassSpecGymModel, ABC):
 
         return metric_vals
 
+    def _get_morgan_fp_with_cache(
+        self, smiles: T.Optional[str], mol: T.Optional[Chem.Mol]
+    ) -> T.Optional[ExplicitBitVect]:
+        """
+        Retrieve the Morgan fingerprint of a molecule from the cache (keyed by SMILES, since the
+        same molecules repeat across batches), or compute and cache it.
+        """
+        if mol is None:
+            return None
+        if smiles not in self.smiles_2_morgan_fp:
+            self.smiles_2_morgan_fp[smiles] = morgan_fp(mol, to_np=False)
+        return self.smiles_2_morgan_fp[smiles]
+
+    def _get_inchi_key_with_cache(
+        self, smiles: T.Optional[str], mol: T.Optional[Chem.Mol]
+    ) -> T.Optional[str]:
+        """
+        Retrieve the InChIKey of a molecule from the cache (keyed by SMILES), or compute and cache
+        it.
+        """
+        if mol is None:
+            return None
+        if smiles not in self.smiles_2_inchi_key:
+            self.smiles_2_inchi_key[smiles] = mol_to_inchi_key(mol)
+        return self.smiles_2_inchi_key[smiles]
 
     def test_step(
         self,
@@ -237,6 +259,6 @@ class DeNovoMassSpecGymModel(MassSpecGymModel, ABC):
     def on_test_epoch_end(self):
         # Save test data frame to disk
         if self.df_test_path is not None:
-            df_test = pd.DataFrame(self.df_test)
+            df_test = self._get_df_test()
             self.df_test_path.parent.mkdir(parents=True, exist_ok=True)
             df_test.to_pickle(self.df_test_path)
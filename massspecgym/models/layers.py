@@ -26,6 +26,10 @@ class FourierFeatures(nn.Module):
         sigma (float, optional): Standard deviation used for random frequency initialization
             when strategy is 'random'. Defaults to 10.
         num_freqs (int, optional): Number of frequency components to generate. Defaults to 512.
+        compile_forward (bool, optional): If True, the transformation is compiled with
+            `torch.compile`, fusing the scaling and trigonometric functions into fewer kernels and
+            avoiding materializing intermediate tensors of the (large) output size. Defaults to
+            False.
     """
 
     def __init__(
@@ -37,6 +41,7 @@ class FourierFeatures(nn.Module):
         funcs="both",
         sigma=10,
         num_freqs=512,
+        compile_forward=False,
     ):
         assert funcs in {"both", "sin", "cos"}, "funcs must be 'both', 'sin', or 'cos'"
         assert 0 < x_min < 1, "x_min must be a positive fraction"
@@ -68,6 +73,11 @@ class FourierFeatures(nn.Module):
         self.b = nn.Parameter(self.b, requires_grad=self.trainable)
         self.register_parameter("Fourier frequencies", self.b)
 
+        # Dynamic shapes since the number of peaks varies between batches
+        self.fourier_features_fn = fourier_features
+        if compile_forward:
+            self.fourier_features_fn = torch.compile(fourier_features, dynamic=True)
+
     @property
     def num_features(self):
         """
@@ -89,13 +99,25 @@ class FourierFeatures(nn.Module):
         Returns:
             torch.Tensor: Fourier features.
         """
-        x = 2 * torch.pi * x @ self.b
+        return self.fourier_features_fn(x, self.b, self.funcs)
+
+
+def fourier_features(x: torch.Tensor, b: torch.Tensor, funcs: str = "both") -> torch.Tensor:
+    """
+    Map the input data to Fourier features with frequencies `b` (see `FourierFeatures`).
+
+    Args:
+        x (torch.Tensor): Input tensor of shape (..., input_dim) to transform.
+        b (torch.Tensor): Frequencies of shape (input_dim, num_freqs).
+        funcs (str, optional): Trigonometric functions to use ('both', 'sin', or 'cos').
+    """
+    x = 2 * torch.pi * x @ b
 
-        if self.funcs == "both":
-            x = torch.cat((torch.cos(x), torch.sin(x)), dim=-1)
-        elif self.funcs == "cos":
-            x = torch.cos(x)
-        elif self.funcs == "sin":
-            x = torch.sin(x)
+    if funcs == "both":
+        x = torch.cat((torch.cos(x), torch.sin(x)), dim=-1)
+    elif funcs == "cos":
+        x = torch.cos(x)
+    elif funcs == "sin":
+        x = torch.sin(x)
 
-        return x
+    return x
@@ -91,7 +91,7 @@ class RetrievalMassSpecGymModel(MassSpecGymModel, ABC):
             hit_rates = []
             for scores_sample, labels_sample in zip(scores, labels):
                 hit_rates.append(retrieval_hit_rate(scores_sample, labels_sample, top_k=at_k))
-            hit_rates = torch.tensor(hit_rates, device=batch_ptr.device)
+            hit_rates = torch.stack(hit_rates)
 
             metric_name = f"{stage.to_pref()}hit_rate@{at_k}"
             self._update_metric(
@@ -123,13 +123,13 @@ class RetrievalMassSpecGymModel(MassSpecGymModel, ABC):
         # Initialize return dictionary to store metric values per sample
         metric_vals = {}
 
-        # Get top-1 predicted molecules for each ground-truth sample
-        smiles_pred_top_1 = []
-        batch_ptr = torch.cumsum(batch_ptr, dim=0)
-        for i, j in zip(torch.cat([torch.tensor([0], device=batch_ptr.device), batch_ptr]), batch_ptr):
-            scores_sample = scores[i:j]
-            top_1_idx = i + torch.argmax(scores_sample)
-            smiles_pred_top_1.append(candidates_smiles[top_1_idx])
+        # Get top-1 predicted molecules for each ground-truth sample (with the candidate offsets
+        # and the top-1 indices transferred to the host at once rather than per sample)
+        batch_ptr = [0] + torch.cumsum(batch_ptr, dim=0).tolist()
+        top_1_idxs = torch.stack([
+            i + torch.argmax(scores[i:j]) for i, j in zip(batch_ptr[:-1], batch_ptr[1:])
+        ]).tolist()
+        smiles_pred_top_1 = [candidates_smiles[i] for i in top_1_idxs]
 
         # Calculate MCES distance between top-1 predicted molecules and ground truth
         mces_dists = [
@@ -203,6 +203,6 @@ class RetrievalMassSpecGymModel(MassSpecGymModel, ABC):
     def on_test_epoch_end(self):
         # Save test data frame to disk
         if self.df_test_path is not None:
-            df_test = pd.DataFrame(self.df_test)
+            df_test = self._get_df_test()
             self.df_test_path.parent.mkdir(parents=True, exist_ok=True)
             df_test.to_pickle(self.df_test_path)
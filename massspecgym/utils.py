@@ -8,6 +8,8 @@ import matplotlib.colors as mcolors
 import matplotlib.ticker as ticker
 import pandas as pd
 import typing as T
+import mmap
+import warnings
 import pulp
 import torch
 import torch.nn as nn
@@ -434,10 +436,13 @@ def unbatch_list(batch_list: list, batch_idx: torch.Tensor) -> list:
         batch_list (list): List of items to unbatch.
         batch_idx (Tensor): Tensor of batch indexes.
     """
-    return [
-        [batch_list[j] for j in range(len(batch_list)) if batch_idx[j] == i]
-        for i in range(batch_idx[-1] + 1)
-    ]
+    # Transfer the indexes to the host once instead of reading them element by element (which
+    # synchronizes with the device for every comparison)
+    batch_idx = batch_idx.tolist()
+    unbatched = [[] for _ in range(batch_idx[-1] + 1)]
+    for item, i in zip(batch_list, batch_idx):
+        unbatched[i].append(item)
+    return unbatched
 
 
 class CosSimLoss(nn.Module):
@@ -504,3 +509,97 @@ def parse_sirius_ms(spectra_file: str) -> T.Tuple[dict, T.List[T.Tuple[str, np.n
     metadata["_FILE_PATH"] = spectra_file
     metadata["_FILE"] = Path(spectra_file).stem
     return metadata, spectras
+
+
+def parse_mgf(
+    pth: T.Union[str, Path]
+) -> T.Tuple[np.ndarray, np.ndarray, np.ndarray, pd.DataFrame]:
+    """
+    Parse spectra from an .mgf file directly into numpy arrays, without constructing matchms
+    spectra. The file is memory-mapped and the peaks of each spectrum are parsed by a single numpy
+    call. Peak lines consist of an m/z value, an intensity and an optional charge, which is ignored.
+    Metadata keys are lower-cased and the precursor m/z (read from the `PRECURSOR_MZ` or `PEPMASS`
+    fields), charge and retention time are converted to numbers as in matchms; unlike in matchms,
+    other metadata values are kept as strings.
+
+    Args:
+        pth (Union[str, Path]): Path to the .mgf file.
+
+    Returns:
+        T.Tuple[np.ndarray, np.ndarray, np.ndarray, pd.DataFrame]: Numbers of peaks of the spectra,
+            concatenated m/z values and intensities of all spectra (sorted by m/z within each
+            spectrum), and a data frame with the metadata of the spectra.
+    """
+    n_peaks, mzs, intensities, metadata = [], [], [], []
+    with open(pth, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            warnings.catch_warnings():
+        # np.fromstring warns when it stops at an invalid token, which is detected below
+        warnings.simplefilter("ignore", DeprecationWarning)
+        pos = mm.find(b"BEGIN IONS")
+        while pos != -1:
+            end = mm.find(b"END IONS", pos)
+            if end == -1:
+                raise ValueError(f"Unterminated spectrum at byte {pos} of {pth}.")
+            lines = mm[pos + len(b"BEGIN IONS"):end].decode().splitlines()
+
+            # Metadata lines (KEY=VALUE) precede the peak lines
+            meta, i = {}, 0
+            while i < len(lines) and (not lines[i].strip() or "=" in lines[i]):
+                if lines[i].strip():
+                    key, value = lines[i].split("=", 1)
+                    meta[key.strip().lower()] = value.strip()
+                i += 1
+
+            # Parse all peaks at once if there are exactly two numbers per line, and validate
+            # them line by line otherwise (e.g., for charges or invalid values)
+            peak_lines = [line for line in lines[i:] if line.strip()]
+            peaks = np.fromstring(" ".join(peak_lines), sep=" ")
+            if len(peaks) == 2 * len(peak_lines):
+                peaks = peaks.reshape(-1, 2)
+            else:
+                peaks = _parse_mgf_peak_lines(peak_lines, f"spectrum {len(n_peaks)} of {pth}")
+            peaks = peaks[np.argsort(peaks[:, 0], kind="stable")]
+
+            n_peaks.append(len(peaks))
+            mzs.append(peaks[:, 0])
+            intensities.append(peaks[:, 1])
+            metadata.append(meta)
+            pos = mm.find(b"BEGIN IONS", end)
+
+    metadata = pd.DataFrame(metadata)
+    if "pepmass" in metadata.columns:
+        # Drop the optional precursor intensity
+        pepmass = metadata.pop("pepmass").str.split().str[0]
+        metadata["precursor_mz"] = metadata["precursor_mz"].fillna(pepmass) \
+            if "precursor_mz" in metadata.columns else pepmass
+    for key in ["precursor_mz", "retention_time"]:
+        if key in metadata.columns:
+            metadata[key] = pd.to_numeric(metadata[key], errors="coerce").astype(np.float64)
+    if "charge" in metadata.columns:
+        # Charges such as "2-", "-2", "2+" or "2"
+        charge = metadata["charge"].str.strip()
+        negative = charge.str.endswith("-", na=False) | charge.str.startswith("-", na=False)
+        sign = np.where(negative, -1, 1)
+        charge = sign * pd.to_numeric(charge.str.strip("+-"), errors="coerce")
+        metadata["charge"] = charge.astype(np.int64) if charge.notna().all() else charge
+
+    return (
+        np.array(n_peaks, dtype=np.int64),
+        np.concatenate(mzs) if mzs else np.empty(0),
+        np.concatenate(intensities) if intensities else np.empty(0),
+        metadata,
+    )
+
+
+def _parse_mgf_peak_lines(lines: T.List[str], spec_name: str) -> np.ndarray:
+    """
+    Parse peak lines of an .mgf spectrum consisting of an m/z value, an intensity and an optional
+    charge one by one, raising an error naming the spectrum for invalid lines.
+    """
+    peaks = [line.split() for line in lines]
+    if any(len(peak) not in (2, 3) for peak in peaks):
+        raise ValueError(f"Invalid peak line in {spec_name}.")
+    try:
+        return np.array([peak[:2] for peak in peaks], dtype=np.float64).reshape(-1, 2)
+    except ValueError as e:
+        raise ValueError(f"Invalid peak in {spec_name}: {e}") from e
@@ -0,0 +1,42 @@
+import pytest
+from massspecgym.data import MassSpecDataModule, MassSpecDataset
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    return MassSpecDataset(
+        pth="data/debug/example_5_spectra.mgf", return_mol_freq=False, cache_dir=tmp_path
+    )
+
+
+def write_split(pth, folds):
+    pth.write_text("identifier\tfold\n" + "".join(f"{i}\t{fold}\n" for i, fold in folds))
+    return pth
+
+
+def test_split(dataset, tmp_path):
+    # Items of the split file in a different order than in the dataset
+    split_pth = write_split(
+        tmp_path / "split.tsv",
+        [("5", "val"), ("1", "test"), ("3", "train"), ("2", "val"), ("4", "train")]
+    )
+    data_module = MassSpecDataModule(dataset, batch_size=2, split_pth=split_pth)
+
+    data_module.setup()
+    assert list(data_module.train_dataset.indices) == [2, 3]
+    assert list(data_module.val_dataset.indices) == [1, 4]
+    data_module.setup("test")
+    assert list(data_module.test_dataset.indices) == [0]
+    assert dataset.identifier[data_module.test_dataset.indices].tolist() == ["1"]
+
+
+@pytest.mark.parametrize("invalid_fold", ["", "training"])
+def test_split_invalid_fold(dataset, tmp_path, invalid_fold):
+    split_pth = write_split(
+        tmp_path / "split.tsv",
+        [("1", "train"), ("2", invalid_fold), ("3", "val"), ("4", "test"), ("5", "test")]
+    )
+    data_module = MassSpecDataModule(dataset, batch_size=2, split_pth=split_pth)
+
+    with pytest.raises(ValueError, match="Folds"):
+        data_module.setup()
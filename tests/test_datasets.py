@@ -0,0 +1,256 @@
+import json
+import pickle
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+import matchms.importing
+from rdkit import Chem
+from massspecgym.data.datasets import MassSpecDataset, RetrievalDataset
+from massspecgym.data.transforms import (
+    MolTransform, SpecTokenizer, MolFingerprinter, MolToInChIKey
+)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = tmp_path / "data"
+    shutil.copytree("data/debug", data_dir)
+    return data_dir
+
+
+def assert_items_equal(item_1, item_2):
+    assert item_1.keys() == item_2.keys()
+    for k in item_1:
+        if isinstance(item_1[k], torch.Tensor):
+            assert torch.equal(item_1[k], item_2[k])
+        else:
+            assert item_1[k] == item_2[k]
+
+
+@pytest.mark.parametrize("half_precision_intensities", [False, True])
+def test_mgf_dataset(data_dir, half_precision_intensities):
+    pth = data_dir / "example_5_spectra.mgf"
+    ds = MassSpecDataset(
+        pth=pth, cache_dir=data_dir / "cache",
+        half_precision_intensities=half_precision_intensities
+    )
+    spectra = list(matchms.importing.load_from_mgf(str(pth)))
+
+    assert len(ds) == len(spectra)
+    for i, s in enumerate(spectra):
+        spec = ds.get_spectrum(i)
+        assert np.array_equal(spec.peaks.mz, s.peaks.mz)
+        if half_precision_intensities:
+            # Intensities are cached in half precision relative to the maximum intensity
+            assert np.allclose(
+                spec.peaks.intensities, s.peaks.intensities,
+                rtol=1e-3, atol=1e-3 * s.peaks.intensities.max()
+            )
+        else:
+            assert np.array_equal(spec.peaks.intensities, s.peaks.intensities)
+        assert spec.get("precursor_mz") == s.get("precursor_mz")
+        assert ds.identifier[i] == s.get("identifier")
+        assert ds.smiles[i] == s.get("smiles")
+
+
+def test_tsv_dataset(data_dir):
+    spectra = list(matchms.importing.load_from_mgf(str(data_dir / "example_5_spectra.mgf")))
+    pth = data_dir / "example_5_spectra.tsv"
+    pd.DataFrame({
+        "identifier": [s.get("identifier") for s in spectra],
+        "mzs": [",".join(map(str, s.peaks.mz)) for s in spectra],
+        "intensities": [",".join(map(str, s.peaks.intensities)) for s in spectra],
+        "smiles": [s.get("smiles") for s in spectra],
+        "adduct": [s.get("adduct") for s in spectra],
+        "precursor_mz": [s.get("precursor_mz") for s in spectra],
+    }).to_csv(pth, sep="\t", index=False)
+    ds = MassSpecDataset(pth=pth, cache_dir=data_dir / "cache")
+
+    assert len(ds) == len(spectra)
+    for i, s in enumerate(spectra):
+        spec = ds.get_spectrum(i)
+        assert np.array_equal(spec.peaks.mz, s.peaks.mz)
+        assert np.array_equal(spec.peaks.intensities, s.peaks.intensities)
+        assert ds.precursor_mz[i] == s.get("precursor_mz")
+
+
+def test_cache_reuse_and_rebuild(data_dir, monkeypatch):
+    pth = data_dir / "example_5_spectra.mgf"
+    cache_dir = data_dir / "cache"
+    spec_transform = SpecTokenizer(n_peaks=60)
+    ds = MassSpecDataset(pth=pth, spec_transform=spec_transform, cache_dir=cache_dir)
+
+    # The cache is reused without parsing the file again
+    def parse_mgf(pth):
+        raise AssertionError("The cache was not reused.")
+
+    with monkeypatch.context() as m:
+        m.setattr("massspecgym.utils.parse_mgf", parse_mgf)
+        ds_cached = MassSpecDataset(pth=pth, spec_transform=spec_transform, cache_dir=cache_dir)
+    assert ds_cached.cache_pth == ds.cache_pth
+    for i in range(len(ds)):
+        assert_items_equal(ds_cached[i], ds[i])
+
+    # A separate cache is built for half-precision intensities
+    ds_half = MassSpecDataset(pth=pth, cache_dir=cache_dir, half_precision_intensities=True)
+    assert ds_half.cache_pth != ds.cache_pth
+    assert ds_half.intensities.dtype == np.float16 and ds.intensities.dtype == np.float64
+
+    # The cache is rebuilt when the file changes
+    text = pth.read_text()
+    pth.write_text(text[:text.rindex("BEGIN IONS")])
+    ds_changed = MassSpecDataset(pth=pth, cache_dir=cache_dir)
+    assert ds_changed.cache_pth != ds.cache_pth
+    assert len(ds_changed) == len(ds) - 1
+
+
+def test_identifiers_subset(data_dir):
+    pth = data_dir / "example_5_spectra.mgf"
+    kwargs = dict(
+        pth=pth, spec_transform=SpecTokenizer(n_peaks=60), mol_transform=MolFingerprinter(),
+        return_mol_freq=False, cache_dir=data_dir / "cache"
+    )
+    ds = MassSpecDataset(**kwargs)
+    ds_subset = MassSpecDataset(identifiers_subset=["2", "4"], **kwargs)
+
+    assert len(ds_subset) == 2
+    for i_subset, i in enumerate([1, 3]):
+        assert_items_equal(ds_subset[i_subset], ds[i])
+
+
+def test_retrieval_dataset(data_dir):
+    ds = RetrievalDataset(
+        pth=data_dir / "example_5_spectra.mgf",
+        candidates_pth=data_dir / "example_5_spectra_candidates.json",
+        spec_transform=SpecTokenizer(n_peaks=60),
+        mol_transform=MolFingerprinter(),
+        cache_dir=data_dir / "cache",
+    )
+    with open(data_dir / "example_5_spectra_candidates.json") as f:
+        candidates = json.load(f)
+    to_inchi_key = MolToInChIKey()
+
+    for i in range(len(ds)):
+        item = ds[i]
+        assert item["candidates_smiles"] == candidates[item["smiles"]]
+        assert item["labels"] == [
+            to_inchi_key(c) == to_inchi_key(item["smiles"]) for c in item["candidates_smiles"]
+        ]
+        assert item["candidates"].shape == (len(item["candidates_smiles"]), 2048)
+
+
+@pytest.mark.parametrize("n_peaks", [None, 60])
+def test_collate_fn(data_dir, n_peaks):
+    ds = MassSpecDataset(
+        pth=data_dir / "example_5_spectra.mgf",
+        spec_transform=SpecTokenizer(n_peaks=n_peaks),
+        cache_dir=data_dir / "cache",
+    )
+    items = [ds[i] for i in range(len(ds))]
+
+    # The layout of the batch does not depend on its size or on the numbers of peaks
+    for batch in [items, items[:1], [items[0], items[0]]]:
+        collated = ds.collate_fn(batch)
+        if n_peaks is None:
+            assert collated["spec"].dim() == 2
+            assert collated["spec_batch_ptr"].tolist() == [len(item["spec"]) for item in batch]
+            assert torch.equal(collated["spec"], torch.cat([item["spec"] for item in batch]))
+        else:
+            assert collated["spec"].shape == (len(batch), n_peaks + 1, 2)
+            assert "spec_batch_ptr" not in collated
+        assert collated["precursor_mz"].shape == (len(batch),)
+
+
+def test_pickle_remaps_arrays(data_dir):
+    ds = RetrievalDataset(
+        pth=data_dir / "example_5_spectra.mgf",
+        candidates_pth=data_dir / "example_5_spectra_candidates.json",
+        spec_transform=SpecTokenizer(n_peaks=60),
+        cache_dir=data_dir / "cache",
+    )
+    ds_unpickled = pickle.loads(pickle.dumps(ds))
+
+    for name in ["mzs", "intensities", "candidates_codes"]:
+        arr = getattr(ds_unpickled, name)
+        assert isinstance(arr, np.memmap) and arr._mmap is not None
+        assert np.array_equal(arr, getattr(ds, name))
+    for i in range(len(ds)):
+        assert_items_equal(ds_unpickled[i], ds[i])
+
+
+def test_retrieval_labels(data_dir):
+    # Invalid SMILES of molecules not used by the dataset items do not break the dataset
+    candidates_pth = data_dir / "example_5_spectra_candidates.json"
+    with open(candidates_pth) as f:
+        candidates = json.load(f)
+    candidates["not_a_smiles"] = ["not_a_smiles", "CC"]
+    with open(candidates_pth, "w") as f:
+        json.dump(candidates, f)
+
+    class MolToSmiles(MolTransform):
+        def from_smiles(self, mol):
+            return Chem.MolToSmiles(Chem.MolFromSmiles(mol))
+
+    kwargs = dict(
+        pth=data_dir / "example_5_spectra.mgf",
+        candidates_pth=candidates_pth,
+        spec_transform=SpecTokenizer(n_peaks=60),
+        identifiers_subset=["1"],
+        cache_dir=data_dir / "cache",
+    )
+    for mol_label_transform in [MolToInChIKey(), MolToSmiles()]:
+        ds = RetrievalDataset(mol_label_transform=mol_label_transform, **kwargs)
+
+        # Only the molecules of the dataset items are labeled
+        assert sum(l is not None for l in ds.queries_labels) == 1
+        assert sum(l is not None for l in ds.candidates_labels) == \
+            len(set(candidates[ds.smiles[0]]))
+        item = ds[0]
+        assert item["labels"] == [
+            mol_label_transform(c) == mol_label_transform(item["smiles"])
+            for c in item["candidates_smiles"]
+        ]
+
+    # Labels are stored on disk only for transformations with a cache key
+    labels_pths = list((data_dir / "cache").glob("*/labels_*.pkl"))
+    assert [pth.name for pth in labels_pths] == ["labels_inchikey_2d.pkl"]
+
+    # Stored labels are extended by the molecules of further items
+    ds = RetrievalDataset(**{**kwargs, "identifiers_subset": None})
+    assert sum(l is not None for l in ds.queries_labels) == len(ds)
+    for i in range(len(ds)):
+        assert sum(ds[i]["labels"]) >= 1
+    cached = pd.read_pickle(labels_pths[0])
+    assert cached["queries"][1].sum() == len(ds)
+
+
+def test_missing_smiles(data_dir):
+    pth = data_dir / "example_5_spectra.mgf"
+    # Remove the SMILES of the first spectrum
+    text = pth.read_text()
+    start = text.index("SMILES=")
+    pth.write_text(text[:start] + text[text.index("\n", start) + 1:])
+
+    with pytest.raises(ValueError, match="missing SMILES"):
+        MassSpecDataset(
+            pth=pth, mol_transform=MolFingerprinter(), return_mol_freq=False,
+            cache_dir=data_dir / "cache"
+        )
+
+
+def test_precomputed_candidates(data_dir):
+    kwargs = dict(
+        pth=data_dir / "example_5_spectra.mgf",
+        candidates_pth=data_dir / "example_5_spectra_candidates.json",
+        spec_transform=SpecTokenizer(n_peaks=60),
+        mol_transform=MolFingerprinter(),
+        cache_dir=data_dir / "cache",
+    )
+    ds = RetrievalDataset(**kwargs)
+    ds_not_precomputed = RetrievalDataset(precompute_mol=False, **kwargs)
+
+    assert ds.candidates_mol_cache is not None
+    for i in range(len(ds)):
+        assert_items_equal(ds[i], ds_not_precomputed[i])
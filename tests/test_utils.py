@@ -1,5 +1,8 @@
+import pytest
 import numpy as np
+import pandas as pd
 import matchms
+import matchms.importing
 import os
 from rdkit.Chem import AllChem as Chem
 import massspecgym.utils as utils
@@ -68,3 +71,37 @@ def test_standardize_smiles():
     except ImportError:
         os.system("pip install git+https://github.com/boecker-lab/standardizeUtils@b415f1c51b49f6c5cd0e9c6ab89224c8ad657a35#egg=standardizeUtils")
         asserts()
+
+
+def test_parse_mgf():
+    pth = "data/debug/example_5_spectra.mgf"
+    n_peaks, mzs, intensities, metadata = utils.parse_mgf(pth)
+    spectra = list(matchms.importing.load_from_mgf(pth))
+
+    assert n_peaks.tolist() == [len(s.peaks.mz) for s in spectra]
+    assert np.array_equal(mzs, np.concatenate([s.peaks.mz for s in spectra]))
+    assert np.array_equal(intensities, np.concatenate([s.peaks.intensities for s in spectra]))
+    metadata_matchms = pd.DataFrame([s.metadata for s in spectra])
+    pd.testing.assert_frame_equal(metadata, metadata_matchms[metadata.columns])
+    assert set(metadata.columns) == set(metadata_matchms.columns)
+
+
+def test_parse_mgf_peak_lines(tmp_path):
+    pth = tmp_path / "spectra.mgf"
+
+    # Peak lines may contain charges as a third column
+    pth.write_text("BEGIN IONS\nPEPMASS=100.0 5000\n3.0 4.0 1+\n1.0 2.0 1+\nEND IONS\n")
+    n_peaks, mzs, intensities, metadata = utils.parse_mgf(pth)
+    assert n_peaks.tolist() == [2]
+    assert mzs.tolist() == [1.0, 3.0]
+    assert intensities.tolist() == [2.0, 4.0]
+    assert metadata["precursor_mz"].tolist() == [100.0]
+
+    # Malformed peak lines raise errors instead of truncating the spectrum
+    for peaks in ["1.0 2.0\nx 4.0\n5.0 6.0", "1.0 2.0\n3.0\n5.0 6.0"]:
+        pth.write_text(
+            "BEGIN IONS\nPEPMASS=100.0\n1.0 2.0\nEND IONS\n"
+            f"BEGIN IONS\nPEPMASS=100.0\n{peaks}\nEND IONS\n"
+        )
+        with pytest.raises(ValueError, match="spectrum 1"):
+            utils.parse_mgf(pth)